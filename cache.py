@@ -0,0 +1,139 @@
+"""
+cache.py
+Caché en disco para los datos de Yahoo Finance.
+ - Un fichero JSON por (ticker, endpoint): .cache/{ticker}/{endpoint}.json
+ - Cada entrada guarda {"ts": epoch, "ttl": segundos, "data": ...}
+ - Soporta DataFrame/Series de pandas, fechas y tipos JSON básicos
+"""
+
+import json
+import os
+import tempfile
+import time
+from datetime import date, datetime
+from io import StringIO
+
+import pandas as pd
+
+DEFAULT_CACHE_DIR = ".cache"
+
+DAY = 24 * 60 * 60
+
+
+def _strip_tz(obj):
+    """Quita la zona horaria del índice conservando la hora local del mercado."""
+    if isinstance(obj.index, pd.DatetimeIndex) and obj.index.tz is not None:
+        obj = obj.copy()
+        obj.index = obj.index.tz_localize(None)
+    return obj
+
+
+def _encode(obj):
+    """Convierte el objeto en algo serializable en JSON (con etiqueta de tipo)."""
+    if isinstance(obj, pd.DataFrame):
+        return {"__type__": "DataFrame",
+                "data": _strip_tz(obj).to_json(orient='split', date_format='iso')}
+    if isinstance(obj, pd.Series):
+        return {"__type__": "Series",
+                "data": _strip_tz(obj).to_json(orient='split', date_format='iso')}
+    if isinstance(obj, datetime):
+        return {"__type__": "datetime", "data": obj.isoformat()}
+    if isinstance(obj, date):
+        return {"__type__": "date", "data": obj.isoformat()}
+    if isinstance(obj, dict):
+        return {str(k): _encode(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_encode(v) for v in obj]
+    if obj is None or isinstance(obj, (str, bool, int, float)):
+        return obj
+    # Tipos numpy y similares
+    if hasattr(obj, 'item'):
+        return obj.item()
+    return str(obj)
+
+
+def _is_empty(obj):
+    """Datos vacíos: no se cachean (pueden deberse a un fallo puntual de Yahoo)."""
+    if obj is None:
+        return True
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        return obj.empty
+    if isinstance(obj, (dict, list, tuple)):
+        return not obj
+    return False
+
+
+def _decode(obj):
+    """Operación inversa de _encode."""
+    if isinstance(obj, dict):
+        kind = obj.get("__type__")
+        if kind == "DataFrame":
+            return pd.read_json(StringIO(obj["data"]), orient='split', typ='frame')
+        if kind == "Series":
+            return pd.read_json(StringIO(obj["data"]), orient='split', typ='series')
+        if kind == "datetime":
+            return datetime.fromisoformat(obj["data"])
+        if kind == "date":
+            return date.fromisoformat(obj["data"])
+        return {k: _decode(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_decode(v) for v in obj]
+    return obj
+
+
+class FileCache:
+    """Caché clave-valor en disco con caducidad (TTL) por entrada."""
+
+    def __init__(self, root=DEFAULT_CACHE_DIR):
+        self.root = root
+
+    def _path(self, ticker, endpoint):
+        return os.path.join(self.root, ticker, f"{endpoint}.json")
+
+    def get(self, ticker, endpoint, ttl=None):
+        """
+        Devuelve (True, datos) si hay entrada vigente, si no (False, None).
+        Si se indica ttl, prevalece sobre el guardado en la entrada (así un
+        TTL más corto en la configuración afecta también a la caché existente).
+        """
+        path = self._path(ticker, endpoint)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            max_age = entry["ttl"] if ttl is None else ttl
+            if time.time() - entry["ts"] > max_age:
+                return False, None
+            return True, _decode(entry["data"])
+        except FileNotFoundError:
+            return False, None
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[AVISO] Caché corrupta en {path}: {e}. Se ignora.")
+            return False, None
+
+    def set(self, ticker, endpoint, ttl, data):
+        """Guarda la entrada de forma atómica (fichero temporal + os.replace)."""
+        path = self._path(ticker, endpoint)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entry = {"ts": time.time(), "ttl": ttl, "data": _encode(data)}
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+            os.replace(tmp, path)
+        except Exception:
+            os.remove(tmp)
+            raise
+
+    def get_or_fetch(self, ticker, endpoint, ttl, fetch):
+        """Devuelve el dato cacheado o lo descarga con fetch() y lo guarda."""
+        hit, data = self.get(ticker, endpoint, ttl)
+        if hit:
+            return data
+        data = fetch()
+        if _is_empty(data):
+            return data
+        try:
+            self.set(ticker, endpoint, ttl, data)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"[AVISO] No se pudo guardar en caché {ticker}/{endpoint}: {e}")
+        return data
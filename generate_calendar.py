@@ -12,23 +12,41 @@ Versión mejorada:
  - SOLUCIONADO (Error): Corrige el error por 'float' (nan) en tk.calendar 
    para tickers como ASTS o FTNT.
  - NUEVO: Filtra eventos para mostrar solo ± 3 meses
+ - NUEVO: Caché en disco (.cache/) de los datos de Yahoo, ver cache.py
+ - NUEVO: Escribe el .ics directamente (sin la librería 'ics')
 """
 
 import os
+import functools
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import yfinance as yf
+import numpy as np
 import pandas as pd
 import requests
-from ics import Calendar, Event
-from datetime import datetime, date, timedelta
-from dateutil import parser
+from requests.adapters import HTTPAdapter
+from datetime import date
 from dateutil.relativedelta import relativedelta
-import math
+from cache import FileCache, DAY
 
 # ---------- CONFIG ----------
 
 HOLDINGS_CSV = "holdings.csv"
 EUR = "EUR"
 
+# Descarga concurrente de tickers (I/O de red)
+MAX_WORKERS = 8
+
+# Caché en disco de Yahoo (TTL según la frecuencia con que cambia cada dato)
+CACHE_DIR = ".cache"
+CACHE_TTL = {
+    "info": 1 * DAY,
+    "calendar": 1 * DAY,
+    "earnings_dates": 7 * DAY,
+    # Única fuente de pagos y fechas ex-dividendo: debe recoger enseguida
+    # los dividendos nuevos, así que se refresca a diario
+    "actions": 1 * DAY,
+}
+
 # Retenciones por país
 FOREIGN_WITHHOLDING = {
     "ES": 0.19,
@@ -51,57 +69,101 @@ MARKET_CURRENCY = {
     "NYSE": "USD"
 }
 
+# Sesión HTTP reutilizable para el tipo de cambio (evita un handshake TLS por llamada)
+_FX_SESSION = requests.Session()
+_FX_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+_CACHE = FileCache(CACHE_DIR)
+
 # ---------- FUNCIONES ----------
 
+@functools.lru_cache(maxsize=32)
+def _get_fx_rate_cached(base_currency: str, target_currency: str):
+    """Consulta open.er-api.com. Lanza excepción si falla (no se cachea)."""
+    url = f"https://open.er-api.com/v6/latest/{base_currency}"
+    r = _FX_SESSION.get(url, timeout=10)
+    r.raise_for_status()
+    data = r.json()
+    if data.get("result") == "success" and target_currency in data.get("rates", {}):
+        return float(data["rates"][target_currency])
+    raise LookupError(f"No se encontró tipo de cambio {base_currency}->{target_currency}")
+
+
 def get_fx_rate(base_currency: str, target_currency: str = EUR):
-    """Consulta tipo de cambio usando open.er-api.com"""
+    """Consulta tipo de cambio usando open.er-api.com (una vez por par y ejecución)"""
     base_currency = (base_currency or "EUR").upper()
     target_currency = target_currency.upper()
     if base_currency == target_currency:
         return 1.0
 
     try:
-        url = f"https://open.er-api.com/v6/latest/{base_currency}"
-        r = requests.get(url, timeout=10)
-        r.raise_for_status()
-        data = r.json()
-        if data.get("result") == "success" and target_currency in data.get("rates", {}):
-            return float(data["rates"][target_currency])
-        else:
-            print(f"[AVISO] No se encontró tipo de cambio {base_currency}->{target_currency}, se usa 1.0")
-            return 1.0
+        return _get_fx_rate_cached(base_currency, target_currency)
     except Exception as e:
         print(f"[AVISO] Error tipo de cambio {base_currency}->{target_currency}: {e}. Se usa 1.0.")
         return 1.0
 
 
 def compute_net(gross_total, rate_foreign, spanish_rate=SPANISH_RATE):
-    """Calcula retención extranjera + española"""
-    withholding_foreign = gross_total * rate_foreign
-    spanish_theoretical = gross_total * spanish_rate
-    spanish_to_pay = max(0.0, spanish_theoretical - withholding_foreign)
-    net_total = gross_total - withholding_foreign - spanish_to_pay
+    """Calcula retención extranjera + española (un solo importe, ver compute_net_batch)"""
+    calc = compute_net_batch([gross_total], rate_foreign, spanish_rate)
+    return {k: float(v[0]) for k, v in calc.items()}
+
+def compute_net_batch(gross_totals, rate_foreign, spanish_rate=SPANISH_RATE):
+    """Versión vectorizada de compute_net para un array de importes brutos"""
+    gross_totals = np.asarray(gross_totals, dtype=float)
+    withholding_foreign = gross_totals * rate_foreign
+    spanish_to_pay = np.maximum(0.0, gross_totals * spanish_rate - withholding_foreign)
+    net_total = gross_totals - withholding_foreign - spanish_to_pay
     return {
-        "gross_total": round(gross_total, 6),
-        "withholding_foreign": round(withholding_foreign, 6),
-        "spanish_tax_to_pay": round(spanish_to_pay, 6),
-        "net_total": round(net_total, 6)
+        "gross_total": np.round(gross_totals, 6),
+        "withholding_foreign": np.round(withholding_foreign, 6),
+        "spanish_tax_to_pay": np.round(spanish_to_pay, 6),
+        "net_total": np.round(net_total, 6)
     }
 
 def safe_parse_date(x):
-    """Devuelve datetime.date o None."""
-    if x is None or (isinstance(x, float) and math.isnan(x)):
+    """Devuelve datetime.date o None (sin pasar por dateutil.parser)."""
+    if x is None:
         return None
     try:
-        if isinstance(x, (int, float)):
-            return datetime.fromtimestamp(x).date()
-        if hasattr(x, 'to_pydatetime'):
-            return x.to_pydatetime().date()
-        if pd.isna(x):
-            return None
-        return parser.parse(str(x)).date()
+        ts = pd.to_datetime(x, errors='coerce',
+                            unit='s' if isinstance(x, (int, float)) else None)
     except Exception:
         return None
+    return ts.date() if isinstance(ts, pd.Timestamp) else None
+
+
+def _cached(ticker, endpoint, fetch):
+    """Lee el dato de la caché en disco o lo descarga de Yahoo."""
+    # Se cachea aquí y no a nivel HTTP: yfinance rechaza sesiones con caché
+    # (requests_cache.CachedSession) y gestiona él mismo cookies y crumb.
+    return _CACHE.get_or_fetch(ticker, endpoint, CACHE_TTL[endpoint], fetch)
+
+
+def fetch_basic_info(tk):
+    """
+    Solo nombre y último dividendo. Pide a quoteSummary los módulos
+    'quoteType' y 'defaultKeyStatistics' en lugar de todo tk.info
+    (5 módulos + una segunda petición). Si la API interna de yfinance
+    cambia, se recurre a tk.info.
+    """
+    try:
+        result = tk._quote._fetch(modules=['quoteType', 'defaultKeyStatistics'])
+        data = result['quoteSummary']['result'][0]
+        quote_type = data.get('quoteType') or {}
+        key_stats = data.get('defaultKeyStatistics') or {}
+        info = {
+            'shortName': quote_type.get('shortName'),
+            'longName': quote_type.get('longName'),
+            'lastDividendValue': key_stats.get('lastDividendValue'),
+        }
+    except (AttributeError, KeyError, IndexError, TypeError, yf.exceptions.YFException):
+        info = tk.info
+    return {
+        'shortName': info.get('shortName'),
+        'longName': info.get('longName'),
+        'lastDividendValue': info.get('lastDividendValue') or 0.0,
+    }
 
 
 def fetch_info_for_ticker(ticker):
@@ -115,24 +177,24 @@ def fetch_info_for_ticker(ticker):
     tk = yf.Ticker(ticker)
     out = {
         'shortName': None,
-        'dividends_history': [], # Lista de tuplas: (date, amount)
-        'earnings_dates': [],    # Lista de dates
-        'ex_dividend_dates': [] # Lista de dates
+        'dividends_history': {}, # date -> amount (al final, lista de tuplas)
+        'earnings_dates': set(),    # dates (al final, lista ordenada)
+        'ex_dividend_dates': set() # dates (al final, lista ordenada)
     }
 
     last_div_amount = 0.0
 
     # 1. Info general y último dividendo
     try:
-        info = tk.info
+        info = _cached(ticker, "info", lambda: fetch_basic_info(tk))
         out['shortName'] = info.get('shortName') or info.get('longName')
-        last_div_amount = info.get('lastDividendValue', 0.0)
+        last_div_amount = info.get('lastDividendValue') or 0.0
     except Exception as e:
         print(f"[AVISO] {ticker}: No se pudo cargar 'info': {e}")
 
     # 2. --- DATOS FUTUROS (tk.calendar) ---
     try:
-        cal = tk.calendar
+        cal = _cached(ticker, "calendar", lambda: tk.calendar)
         
         # --- ¡AQUÍ ESTÁ LA CORRECCIÓN MEJORADA! ---
         # Si 'cal' es None, lo saltamos
@@ -156,23 +218,21 @@ def fetch_info_for_ticker(ticker):
                 ed = cal.loc['Earnings Date']
                 next_earn = safe_parse_date(ed[0] if isinstance(ed, (list, pd.Series)) else ed)
                 if next_earn:
-                    out['earnings_dates'].append(next_earn)
+                    out['earnings_dates'].add(next_earn)
             
             # Futura Fecha Ex-Dividendo
             if 'Ex-Dividend Date' in cal.index:
                 exd = cal.loc['Ex-Dividend Date']
                 next_ex_div = safe_parse_date(exd[0] if isinstance(exd, (list, pd.Series)) else exd)
                 if next_ex_div:
-                    out['ex_dividend_dates'].append(next_ex_div)
+                    out['ex_dividend_dates'].add(next_ex_div)
 
             # Futura Fecha de PAGO
             if 'Dividend Date' in cal.index:
                 payd = cal.loc['Dividend Date']
                 next_pay_div = safe_parse_date(payd[0] if isinstance(payd, (list, pd.Series)) else payd)
                 if next_pay_div and last_div_amount > 0:
-                    out['dividends_history'].append(
-                        (next_pay_div, float(last_div_amount))
-                    )
+                    out['dividends_history'][next_pay_div] = float(last_div_amount)
     except Exception as e:
         # Este print ahora mostrará el error que hemos lanzado (ej. "but <class 'float'>")
         print(f"[AVISO] {ticker}: No se pudo cargar 'calendar' (datos futuros): {e}")
@@ -181,66 +241,118 @@ def fetch_info_for_ticker(ticker):
 
     # Historial de Resultados (Earnings)
     try:
-        ed = tk.earnings_dates
+        ed = _cached(ticker, "earnings_dates", lambda: tk.earnings_dates)
         if ed is not None and not ed.empty:
-            out['earnings_dates'].extend([safe_parse_date(d) for d in ed.index])
+            out['earnings_dates'].update(pd.DatetimeIndex(ed.index).dropna().date)
     except Exception as e:
         print(f"[AVISO] {ticker}: No se pudo cargar 'earnings_dates' (historial): {e}")
 
-    # Historial de Pagos de Dividendos (Fecha de PAGO)
-    try:
-        divs = tk.dividends
-        if not divs.empty:
-            for date, amount in divs.items():
-                pay_date = safe_parse_date(date)
-                if pay_date:
-                    out['dividends_history'].append(
-                        (pay_date, float(amount))
-                    )
-    except Exception as e:
-        print(f"[AVISO] {ticker}: No se pudo cargar 'dividends' (historial): {e}")
-
-    # Historial de Fechas Ex-Dividendo (Fecha de CORTE)
+    # Historial de acciones corporativas: una sola descarga (tk.actions)
+    # sirve para los pagos (Fecha de PAGO) y las fechas ex-dividendo
+    # (Fecha de CORTE). Vectorizado: el índice ya es un DatetimeIndex.
     try:
-        actions = tk.actions
+        actions = _cached(ticker, "actions", lambda: tk.actions)
         if actions is not None and 'Dividends' in actions.columns:
-            ex_divs = actions[actions['Dividends'] > 0]
-            for date in ex_divs.index:
-                ex_date = safe_parse_date(date)
-                if ex_date:
-                    out['ex_dividend_dates'].append(ex_date)
+            divs = actions['Dividends']
+            divs = divs[(divs > 0) & divs.index.notna()]
+            div_dates = pd.DatetimeIndex(divs.index).date
+            out['dividends_history'].update(zip(div_dates, divs.to_numpy(dtype=float).tolist()))
+            out['ex_dividend_dates'].update(div_dates)
     except Exception as e:
-        print(f"[AVISO] {ticker}: No se pudo cargar 'actions' (ex-dividend historial): {e}")
+        print(f"[AVISO] {ticker}: No se pudo cargar 'actions' (historial de dividendos): {e}")
 
-    # Limpiar Nones y duplicados
-    out['earnings_dates'] = sorted(list(set([d for d in out['earnings_dates'] if d])))
-    out['ex_dividend_dates'] = sorted(list(set([d for d in out['ex_dividend_dates'] if d])))
-    out['dividends_history'] = sorted(list(set(out['dividends_history'])), key=lambda x: x[0])
+    # Sin duplicados por construcción: solo queda ordenar. En dividendos,
+    # el importe histórico real sustituye al estimado de tk.calendar.
+    out['earnings_dates'] = sorted(out['earnings_dates'])
+    out['ex_dividend_dates'] = sorted(out['ex_dividend_dates'])
+    out['dividends_history'] = sorted(out['dividends_history'].items())
     
     return out
 
 
-def build_events_from_holdings(csv_path=HOLDINGS_CSV):
-    df = pd.read_csv(csv_path, dtype=str)
+def fetch_all_infos(tickers, max_workers=MAX_WORKERS):
+    """Descarga en paralelo la info de cada ticker. Devuelve {ticker: info}."""
+    infos = {}
+    # Cada petición HTTP está acotada por los timeouts propios de yfinance
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        # Un ticker repetido (varios lotes) se descarga una sola vez
+        futures = {pool.submit(fetch_info_for_ticker, t): t for t in dict.fromkeys(tickers)}
+        for fut in as_completed(futures):
+            ticker = futures[fut]
+            try:
+                infos[ticker] = fut.result()
+            except Exception as e:
+                # Un ticker con error no detiene al resto
+                print(f"[ERROR] {ticker}: Fallo al descargar datos: {e}")
+    return infos
+
+
+def make_event(event_date, summary, description, color, ticker):
+    """
+    Crea el dict de un evento con el UID y el DTSTART ya formateados,
+    de modo que write_ics_file solo tenga que volcarlos.
+    """
+    return {
+        "date": event_date,
+        "summary": summary,
+        "description": description,
+        "color": color,
+        "ticker": ticker,
+        "uid": f"{ticker}-{color}-{event_date.isoformat()}@mi.calendario.financiero.v2",
+        "dtstart": event_date.strftime('%Y%m%d'),
+    }
+
+
+def build_events_from_holdings(csv_path=HOLDINGS_CSV, start_date=None, end_date=None):
+    """
+    Construye los eventos de todas las posiciones. Si se indica rango
+    (start_date, end_date) solo se generan eventos dentro de él.
+    """
+    df = pd.read_csv(csv_path, dtype=str).fillna('')
     df['cantidad'] = pd.to_numeric(df['cantidad'], errors='coerce').fillna(0).astype(int)
+    df['ticker'] = df['ticker'].str.strip()
     events = [] 
 
-    for _, row in df.iterrows():
+    # Varios lotes del mismo ticker se agrupan en una sola posición
+    first_cols = {c: 'first' for c in ('name', 'country', 'market') if c in df.columns}
+    df = df.groupby('ticker', as_index=False, sort=False).agg({'cantidad': 'sum', **first_cols})
+
+    # Primero se leen las posiciones válidas...
+    rows = []
+    for row in df.to_dict('records'):
+        ticker = row['ticker']
+        if not ticker:
+            continue
+        cantidad = row['cantidad']
+        if cantidad == 0:
+            continue
+        rows.append({
+            'ticker': ticker,
+            'country': row.get('country', '').strip().upper(),
+            'cantidad': cantidad,
+            'name': row.get('name') or ticker,
+            'market': row.get('market', '').strip().upper(),
+        })
+
+    # ...después se descargan todos los tickers en paralelo...
+    print(f"Descargando datos de {len(rows)} tickers ({MAX_WORKERS} en paralelo)...")
+    infos = fetch_all_infos([r['ticker'] for r in rows])
+
+    # ...y por último se construyen los eventos en orden
+    for row in rows:
+        ticker = row['ticker']
         try:
-            ticker = row['ticker'].strip()
-            if not ticker:
-                continue
+            country = row['country']
+            cantidad = row['cantidad']
+            name = row['name']
+            market = row['market']
 
-            country = row.get('country', '').strip().upper()
-            cantidad = int(row['cantidad'])
-            name = row.get('name') or ticker
-            market = row.get('market', '').strip().upper()
-            if cantidad == 0:
+            info = infos.get(ticker)
+            if info is None:
                 continue
 
             print(f"Procesando: {ticker} ({name})...")
 
-            info = fetch_info_for_ticker(ticker)
             company_name = info.get('shortName') or name
             currency = MARKET_CURRENCY.get(market, "USD")
 
@@ -251,53 +363,60 @@ def build_events_from_holdings(csv_path=HOLDINGS_CSV):
 
             fx = get_fx_rate(currency, EUR)
             rate_foreign = FOREIGN_WITHHOLDING.get(country, DEFAULT_FOREIGN_WITHHOLDING)
+            rate_pct = rate_foreign * 100
+
+            # Se descartan ya aquí los eventos fuera de rango (evita calcular
+            # décadas de dividendos que luego no se guardan)
+            ex_dividend_dates = info.get('ex_dividend_dates', [])
+            dividends_history = info.get('dividends_history', [])
+            earnings_dates = info.get('earnings_dates', [])
+            if start_date and end_date:
+                ex_dividend_dates = [d for d in ex_dividend_dates if start_date <= d <= end_date]
+                dividends_history = [(d, a) for d, a in dividends_history if start_date <= d <= end_date]
+                earnings_dates = [d for d in earnings_dates if start_date <= d <= end_date]
             
             # 1️⃣ Ex-Dividendo (Historial + Futuro)
-            for ex_date in info.get('ex_dividend_dates', []):
+            for ex_date in ex_dividend_dates:
                 desc = f"{company_name} ({ticker})\nFecha Ex-Dividendo (corte): {ex_date}"
-                events.append({
-                    "date": ex_date,
-                    "summary": f"📅Ex-Div – {company_name}",
-                    "description": desc,
-                    "color": "orange",
-                    "ticker": ticker 
-                })
-
-            # 2️⃣ Dividendo (Historial + Futuro)
-            for div_date, div_amount in info.get('dividends_history', []):
-                if div_amount and div_amount > 0:
-                    gross_local = div_amount * cantidad * scale
-                    gross_eur = gross_local * fx
-                    calc = compute_net(gross_eur, rate_foreign, SPANISH_RATE)
+                events.append(make_event(
+                    ex_date, f"📅Ex-Div – {company_name}", desc, "orange", ticker
+                ))
+
+            # 2️⃣ Dividendo (Historial + Futuro), cálculo vectorizado por ticker
+            paid = [(d, a) for d, a in dividends_history if a and a > 0]
+            if paid:
+                per_share = np.array([a for _, a in paid], dtype=float) * scale
+                calc = compute_net_batch(per_share * cantidad * fx, rate_foreign, SPANISH_RATE)
+                rows_calc = zip(
+                    [d for d, _ in paid],
+                    per_share.tolist(),
+                    calc['gross_total'].tolist(),
+                    calc['withholding_foreign'].tolist(),
+                    calc['spanish_tax_to_pay'].tolist(),
+                    calc['net_total'].tolist(),
+                )
+                for div_date, per_share_local, gross, withholding, spanish, net in rows_calc:
                     desc = (
                         f"{company_name} ({ticker})\n"
                         f"Fecha de PAGO: {div_date}\n"
                         f"Cantidad: {cantidad} acciones\n"
-                        f"Div x Acc: {div_amount * scale:.4f} {currency}\n"
+                        f"Div x Acc: {per_share_local:.4f} {currency}\n"
                         f"--- Cálculo en EUR (FX: {fx:.4f}) ---\n"
-                        f"NETO: {calc['net_total']:.2f} EUR\n"
-                        f"Bruto: {calc['gross_total']:.2f} EUR\n"
-                        f"Ret. Origen ({rate_foreign*100}%): -{calc['withholding_foreign']:.2f} EUR\n"
-                        f"Ret. España (dif): -{calc['spanish_tax_to_pay']:.2f} EUR"
+                        f"NETO: {net:.2f} EUR\n"
+                        f"Bruto: {gross:.2f} EUR\n"
+                        f"Ret. Origen ({rate_pct}%): -{withholding:.2f} EUR\n"
+                        f"Ret. España (dif): -{spanish:.2f} EUR"
                     )
-                    events.append({
-                        "date": div_date,
-                        "summary": f"💵Div ({calc['net_total']:.2f}€) – {company_name}",
-                        "description": desc,
-                        "color": "green",
-                        "ticker": ticker 
-                    })
+                    events.append(make_event(
+                        div_date, f"💵Div ({net:.2f}€) – {company_name}", desc, "green", ticker
+                    ))
 
             # 3️⃣ Resultados (earnings) (Historial + Futuro)
-            for earn_date in info.get('earnings_dates', []):
+            for earn_date in earnings_dates:
                 desc = f"{company_name} ({ticker})\nFecha de resultados: {earn_date}"
-                events.append({
-                    "date": earn_date,
-                    "summary": f"💰Result – {company_name}",
-                    "description": desc,
-                    "color": "blue",
-                    "ticker": ticker 
-                })
+                events.append(make_event(
+                    earn_date, f"💰Result – {company_name}", desc, "blue", ticker
+                ))
 
         except Exception as e:
             print(f"[ERROR] {ticker}: {e}")
@@ -305,15 +424,21 @@ def build_events_from_holdings(csv_path=HOLDINGS_CSV):
     return events
 
 
+def ics_escape(text):
+    """Escapa un valor TEXT según RFC 5545 (\\ ; , y saltos de línea)."""
+    return (str(text).replace("\\", "\\\\")
+                     .replace(";", "\\;")
+                     .replace(",", "\\,")
+                     .replace("\r\n", "\\n")
+                     .replace("\n", "\\n"))
+
+
 def write_ics_file(events_list, out_path, start_date, end_date):
     """
     Guarda una lista de eventos en un .ics, filtrando por rango de fechas.
+    El .ics se escribe directamente como texto (solo eventos de día completo);
+    los eventos vienen de make_event con UID y DTSTART ya calculados.
     """
-    if os.path.exists(out_path):
-        os.remove(out_path)
-
-    cal = Calendar()
-    
     filtered_events = []
     for ev in events_list:
         event_date = ev.get("date")
@@ -323,49 +448,52 @@ def write_ics_file(events_list, out_path, start_date, end_date):
     print(f"\n[{out_path}] Eventos encontrados (total): {len(events_list)}")
     print(f"[{out_path}] Eventos guardados (en rango): {len(filtered_events)}")
 
+    parts = ["BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//calendario//EN"]
     for ev in filtered_events:
-        e = Event()
-        e.name = ev["summary"]
-        
-        if not ev["date"]:
-            continue
-            
-        e.begin = datetime.combine(ev["date"], datetime.min.time())
-        e.make_all_day()
-        e.description = ev["description"]
-
-        event_type = ev['color'] 
-        ticker = ev['ticker']
-        date_str = ev['date'].isoformat()
-        e.uid = f"{ticker}-{event_type}-{date_str}@mi.calendario.financiero.v2"
-        
-        e.categories = {ev.get("color", "white")} 
-        cal.events.add(e)
-
-    with open(out_path, "w", encoding="utf-8") as f:
-        f.writelines(cal.serialize_iter())
+        parts += [
+            "BEGIN:VEVENT",
+            f"DTSTART;VALUE=DATE:{ev['dtstart']}",
+            f"CATEGORIES:{ics_escape(ev['color'])}",
+            f"DESCRIPTION:{ics_escape(ev['description'])}",
+            f"SUMMARY:{ics_escape(ev['summary'])}",
+            f"UID:{ev['uid']}",
+            "END:VEVENT",
+        ]
+    parts.append("END:VCALENDAR")
+
+    # RFC 5545: líneas terminadas en CRLF. Escritura atómica: fichero
+    # temporal + os.replace, así nunca queda un .ics a medio escribir.
+    content = "\r\n".join(parts) + "\r\n"
+    tmp = out_path + ".tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8", newline="") as f:
+            f.write(content)
+        os.replace(tmp, out_path)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
     print(f"✅ Calendario actualizado: {out_path}")
 
 
 # ---------- MAIN ----------
 
 if __name__ == "__main__":
-    print("Generando eventos desde holdings...")
-    all_events = build_events_from_holdings(HOLDINGS_CSV)
-    
     today = date.today()
     start_date = today - relativedelta(months=3)
     end_date = today + relativedelta(months=3)
-    
-    print(f"\nFiltrando eventos entre {start_date} y {end_date}...")
-    
-    div_events = [ev for ev in all_events if ev['color'] == 'green']
-    ex_events = [ev for ev in all_events if ev['color'] == 'orange']
-    earn_events = [ev for ev in all_events if ev['color'] == 'blue']
 
-    write_ics_file(div_events, "dividendos_pagados.ics", start_date, end_date)
-    write_ics_file(ex_events, "exdividendos.ics", start_date, end_date)
-    write_ics_file(earn_events, "resultados.ics", start_date, end_date)
+    print(f"Generando eventos desde holdings entre {start_date} y {end_date}...")
+    all_events = build_events_from_holdings(HOLDINGS_CSV, start_date, end_date)
+    
+    # Reparto por calendario en una sola pasada
+    buckets = {'green': [], 'orange': [], 'blue': []}
+    for ev in all_events:
+        buckets[ev['color']].append(ev)
+
+    write_ics_file(buckets['green'], "dividendos_pagados.ics", start_date, end_date)
+    write_ics_file(buckets['orange'], "exdividendos.ics", start_date, end_date)
+    write_ics_file(buckets['blue'], "resultados.ics", start_date, end_date)
     
 
     print("\nProceso completado. Importa los 3 archivos .ics en sus respectivos calendarios de Google.")